@@ -1,12 +1,20 @@
 from __future__ import annotations
 
-import json
+import functools
+import mimetypes
+import os
+import re
 import threading
 import time
 from pathlib import Path
 from urllib.parse import quote
 
-from flask import Flask, abort, jsonify, render_template, request, send_file
+import orjson
+import waitress
+from flask import Flask, Response, abort, jsonify, render_template, request, send_file
+from watchdog.events import FileSystemEventHandler
+from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserver
 
 IMAGE_EXTENSIONS = {
     ".apng",
@@ -20,25 +28,71 @@ IMAGE_EXTENSIONS = {
     ".tiff",
     ".webp",
 }
+# A single C-level scan of the filename, with no throwaway lowercased string
+# per entry the way suffix.lower() allocates one.
+IMAGE_EXT_RE = re.compile(
+    r"\.(?:" + "|".join(sorted(ext[1:] for ext in IMAGE_EXTENSIONS)) + r")$",
+    re.IGNORECASE,
+)
 
 CONFIG_PATH = Path(__file__).with_name("config.json")
+CONFIG_PATH_STR = os.fspath(CONFIG_PATH)
 MIN_DELAY_MS = 250
 CONFIG_POLL_SECONDS = 1.0
+CONFIG_DEBOUNCE_SECONDS = 0.2
+IMAGE_CACHE_MAX_BYTES = 4 * 1024 * 1024
+
+
+class ImageSet:
+    """Immutable struct-of-arrays snapshot of the loaded image folder.
+
+    Parallel tuples avoid the per-image dict overhead of the old
+    list-of-dicts layout; entry i is described by names[i], path_strs[i],
+    urls[i], mtimes[i] and sizes[i].
+    """
+
+    __slots__ = ("names", "path_strs", "urls", "mtimes", "sizes")
+
+    def __init__(
+        self,
+        names: tuple[str, ...] = (),
+        path_strs: tuple[str, ...] = (),
+        urls: tuple[str, ...] = (),
+        mtimes: tuple[float, ...] = (),
+        sizes: tuple[int, ...] = (),
+    ) -> None:
+        self.names = names
+        self.path_strs = path_strs
+        self.urls = urls
+        self.mtimes = mtimes
+        self.sizes = sizes
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+
+EMPTY_IMAGES = ImageSet()
 
 
 class SlideshowState:
     def __init__(self) -> None:
-        self.images: list[dict[str, object]] = []
+        # Published as an immutable snapshot by single assignment, so readers
+        # can grab the reference without taking the lock (atomic under the GIL).
+        self.images = EMPTY_IMAGES
         self.current_index = 0
         self.delay_ms = 3000
         self.is_playing = False
         self.delay_override = False
         self.last_error: str | None = None
+        # Bumped by every mutator; lets readers cheaply detect staleness.
+        self.version = 0
+        self._cached_json: bytes | None = None
+        self._cached_version = -1
         self.lock = threading.Lock()
-        self.condition = threading.Condition(self.lock)
+        self.wake = threading.Event()
 
-    def apply_config(self, images: list[dict[str, object]], delay_ms: int) -> None:
-        with self.condition:
+    def apply_config(self, images: ImageSet, delay_ms: int) -> None:
+        with self.lock:
             was_playing = self.is_playing
             self.images = images
             self.current_index = 0
@@ -46,52 +100,72 @@ class SlideshowState:
                 self.delay_ms = delay_ms
             self.is_playing = was_playing and bool(images)
             self.last_error = None
-            self.condition.notify_all()
+            self.version += 1
+            self.wake.set()
 
     def set_delay(self, delay_ms: int) -> None:
-        with self.condition:
+        with self.lock:
             self.delay_ms = delay_ms
             self.delay_override = True
-            self.condition.notify_all()
+            self.version += 1
+            self.wake.set()
 
     def start(self) -> None:
-        with self.condition:
+        with self.lock:
             if not self.images:
                 raise ValueError("No images loaded")
             self.is_playing = True
-            self.condition.notify_all()
+            self.version += 1
+            self.wake.set()
 
     def stop(self) -> None:
-        with self.condition:
+        with self.lock:
             self.is_playing = False
-            self.condition.notify_all()
+            self.version += 1
+            self.wake.set()
 
     def reset(self) -> None:
-        with self.condition:
+        with self.lock:
             self.current_index = 0
-            self.condition.notify_all()
+            self.version += 1
+            self.wake.set()
 
     def set_error(self, message: str) -> None:
-        with self.condition:
-            self.images = []
+        with self.lock:
+            self.images = EMPTY_IMAGES
             self.current_index = 0
             self.is_playing = False
             self.last_error = message
-            self.condition.notify_all()
+            self.version += 1
+            self.wake.set()
 
     def advance(self) -> None:
         if not self.images:
             self.is_playing = False
             return
-        self.current_index = (self.current_index + 1) % len(self.images)
+        next_index = self.current_index + 1
+        self.current_index = 0 if next_index >= len(self.images) else next_index
+        self.version += 1
+
+
+# Memoize the last parse/scan by mtime so spurious wakeups (touch, no-op
+# saves) skip the JSON reparse and directory rescan entirely.
+_config_cache: dict[tuple[str, int, int], tuple[Path, int]] = {}
+_images_cache: dict[tuple[str, int], ImageSet] = {}
 
 
 def load_config() -> tuple[Path, int]:
-    if not CONFIG_PATH.exists():
+    try:
+        stat = os.stat(CONFIG_PATH_STR)
+    except FileNotFoundError:
         raise FileNotFoundError(f"Config file not found at {CONFIG_PATH}")
 
-    with CONFIG_PATH.open("r", encoding="utf-8") as handle:
-        data = json.load(handle)
+    cache_key = (CONFIG_PATH_STR, stat.st_mtime_ns, stat.st_size)
+    cached = _config_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    data = orjson.loads(CONFIG_PATH.read_bytes())
 
     folder_path = str(data.get("folder_path") or "").strip()
     if not folder_path:
@@ -109,31 +183,65 @@ def load_config() -> tuple[Path, int]:
     delay_ms = int(round(delay_seconds_float * 1000))
     delay_ms = max(delay_ms, MIN_DELAY_MS)
 
-    return Path(folder_path).expanduser().resolve(), delay_ms
+    result = Path(folder_path).expanduser().resolve(), delay_ms
+    _config_cache.clear()
+    _config_cache[cache_key] = result
+    return result
 
 
-def load_images(folder_path: Path) -> list[dict[str, object]]:
+def load_images(folder_path: Path) -> ImageSet:
     if not folder_path.is_dir():
         raise ValueError("folder_path must be a directory")
 
-    files = [
-        file
-        for file in sorted(folder_path.iterdir())
-        if file.is_file() and file.suffix.lower() in IMAGE_EXTENSIONS
-    ]
-
-    if not files:
+    cache_key = (str(folder_path), folder_path.stat().st_mtime_ns)
+    cached = _images_cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    # DirEntry carries file-type info from the directory read itself, so no
+    # per-entry stat() is needed just to filter out subdirectories.
+    with os.scandir(folder_path) as entries_iter:
+        entries = [
+            entry
+            for entry in entries_iter
+            if entry.is_file(follow_symlinks=False) and IMAGE_EXT_RE.search(entry.name)
+        ]
+    entries.sort(key=lambda entry: entry.name)
+
+    if not entries:
         raise ValueError("No image files found in that folder")
 
-    images: list[dict[str, object]] = []
-    for index, file in enumerate(files):
-        name = file.name
-        url = f"/images/{index}/{quote(name)}"
-        images.append({"name": name, "path": file, "url": url})
-
+    # Build the parallel arrays in one pass, hoisting lookups out of the
+    # loop; on multi-thousand-image folders the per-entry overhead adds up.
+    names: list[str] = []
+    path_strs: list[str] = []
+    urls: list[str] = []
+    mtimes: list[float] = []
+    sizes: list[int] = []
+    _quote = quote
+    for index, entry in enumerate(entries):
+        name = entry.name
+        stat = entry.stat()
+        names.append(name)
+        path_strs.append(entry.path)
+        urls.append(f"/images/{index}/{_quote(name, safe='')}")
+        mtimes.append(stat.st_mtime)
+        sizes.append(stat.st_size)
+
+    images = ImageSet(tuple(names), tuple(path_strs), tuple(urls), tuple(mtimes), tuple(sizes))
+    _images_cache.clear()
+    _images_cache[cache_key] = images
     return images
 
 
+@functools.lru_cache(maxsize=64)
+def _read_image(path_str: str, mtime: float) -> bytes:
+    # mtime is part of the key purely to invalidate entries when a file is
+    # rewritten in place between reloads.
+    with open(path_str, "rb") as handle:
+        return handle.read()
+
+
 def apply_config(state: SlideshowState) -> None:
     try:
         folder_path, delay_ms = load_config()
@@ -142,55 +250,123 @@ def apply_config(state: SlideshowState) -> None:
         state.set_error(str(exc))
         return
 
+    _read_image.cache_clear()
     state.apply_config(images, delay_ms)
 
 
 def slideshow_worker(state: SlideshowState) -> None:
     while True:
-        with state.condition:
-            while not state.is_playing:
-                state.condition.wait()
-            delay_seconds = max(state.delay_ms, MIN_DELAY_MS) / 1000.0
-        time.sleep(delay_seconds)
-        with state.condition:
-            if state.is_playing:
-                state.advance()
-
-
-def config_watcher(state: SlideshowState) -> None:
-    last_mtime: float | None = None
+        if not state.is_playing:
+            state.wake.wait()
+            state.wake.clear()
+            continue
 
-    while True:
-        try:
-            mtime = CONFIG_PATH.stat().st_mtime
-        except FileNotFoundError:
-            if last_mtime is not None:
-                state.set_error(f"Config file not found at {CONFIG_PATH}")
-                last_mtime = None
-            time.sleep(CONFIG_POLL_SECONDS)
+        # Wait against a monotonic deadline; any mutator sets state.wake, so
+        # delay changes and stop() interrupt an in-flight wait immediately.
+        deadline = time.monotonic() + max(state.delay_ms, MIN_DELAY_MS) / 1000.0
+        interrupted = False
+        remaining = deadline - time.monotonic()
+        while remaining > 0:
+            if state.wake.wait(remaining):
+                interrupted = True
+                break
+            remaining = deadline - time.monotonic()
+        state.wake.clear()
+
+        if interrupted:
+            # A mutator poked us mid-wait (reset, delay change, reload);
+            # recompute the deadline from the current state without skipping
+            # ahead — only an expired deadline advances the slideshow.
             continue
 
-        if last_mtime is None or mtime != last_mtime:
-            last_mtime = mtime
-            apply_config(state)
+        with state.lock:
+            if state.is_playing:
+                state.advance()
+
 
-        time.sleep(CONFIG_POLL_SECONDS)
+class ConfigEventHandler(FileSystemEventHandler):
+    """Reloads the slideshow when config.json itself changes on disk.
+
+    Editors save via write-temp-then-rename, which produces a burst of
+    events for one logical change; the reload runs on a timer that each
+    event resets, so a burst coalesces into a single apply_config. A file
+    that is genuinely gone when the timer fires surfaces through the normal
+    load_config error path.
+    """
+
+    def __init__(self, state: SlideshowState) -> None:
+        self._state = state
+        self._config_path = CONFIG_PATH_STR
+        self._timer: threading.Timer | None = None
+        self._timer_lock = threading.Lock()
+
+    def _schedule_reload(self) -> None:
+        with self._timer_lock:
+            if self._timer is not None:
+                self._timer.cancel()
+            self._timer = threading.Timer(
+                CONFIG_DEBOUNCE_SECONDS, apply_config, args=(self._state,)
+            )
+            self._timer.daemon = True
+            self._timer.start()
+
+    def on_modified(self, event) -> None:
+        if event.src_path == self._config_path:
+            self._schedule_reload()
+
+    def on_created(self, event) -> None:
+        if event.src_path == self._config_path:
+            self._schedule_reload()
+
+    def on_moved(self, event) -> None:
+        if event.dest_path == self._config_path or event.src_path == self._config_path:
+            self._schedule_reload()
+
+    def on_deleted(self, event) -> None:
+        if event.src_path == self._config_path:
+            self._schedule_reload()
+
+
+def start_config_watcher(state: SlideshowState) -> Observer:
+    if os.environ.get("SLIDESHOW_POLLING_WATCHER"):
+        # File notifications are unreliable on some network mounts; fall back
+        # to a stat-based polling observer when asked.
+        observer = PollingObserver(timeout=CONFIG_POLL_SECONDS)
+    else:
+        observer = Observer()
+    observer.schedule(ConfigEventHandler(state), str(CONFIG_PATH.parent), recursive=False)
+    observer.start()
+    return observer
 
 
 state = SlideshowState()
-apply_config(state)
 
+# Two background threads total: the slideshow worker blocks on its wake event
+# between frames, and the watchdog observer blocks in the kernel until
+# config.json changes — neither polls.
 slideshow_thread = threading.Thread(target=slideshow_worker, args=(state,), daemon=True)
 slideshow_thread.start()
 
-config_thread = threading.Thread(target=config_watcher, args=(state,), daemon=True)
-config_thread.start()
+config_observer = start_config_watcher(state)
+
+# Load the initial config off the main thread so import (and the server
+# binding its port) never waits on a slow disk or a huge image folder;
+# early requests just see the "No images loaded." status until it lands.
+initial_load_thread = threading.Thread(target=apply_config, args=(state,), daemon=True)
+initial_load_thread.start()
 
 app = Flask(__name__, static_folder="static", template_folder="templates")
+# Two ways to keep image bytes out of the Python worker (see README):
+# USE_X_SENDFILE=1 emits an X-Sendfile header carrying the file path, which
+# Apache mod_xsendfile and lighttpd honor; X_ACCEL_REDIRECT_PREFIX points at
+# an internal nginx location and makes the image route answer with an
+# X-Accel-Redirect URI instead, which is the convention nginx acts on.
+app.config["USE_X_SENDFILE"] = os.environ.get("USE_X_SENDFILE") == "1"
+X_ACCEL_REDIRECT_PREFIX = os.environ.get("X_ACCEL_REDIRECT_PREFIX", "")
 
 
 def build_status(
-    images: list[dict[str, object]],
+    images: ImageSet,
     current_index: int,
     is_playing: bool,
     last_error: str | None,
@@ -199,40 +375,44 @@ def build_status(
         if last_error:
             return f"Config error: {last_error}"
         return "No images loaded."
-    index = current_index % len(images)
-    name = images[index]["name"]
+    total = len(images)
+    # The index is in range except briefly around a reload; a compare beats
+    # a modulo on this per-poll path.
+    index = current_index if current_index < total else 0
+    name = images.names[index]
     if is_playing:
-        return f"Playing: {index + 1} of {len(images)} ({name})"
-    return f"Stopped at {index + 1} of {len(images)} ({name})"
+        return f"Playing: {index + 1} of {total} ({name})"
+    return f"Stopped at {index + 1} of {total} ({name})"
 
 
 def serialize_state() -> dict[str, object]:
-    with state.lock:
-        images_snapshot = list(state.images)
-        total = len(images_snapshot)
-        current_index = state.current_index
-        delay_ms = state.delay_ms
-        is_playing = state.is_playing
-        last_error = state.last_error
-        current_image = None
-        if total:
-            index = current_index % total
-            image = images_snapshot[index]
-            current_image = {
-                "index": index,
-                "total": total,
-                "name": image["name"],
-                "url": image["url"],
-            }
-        return {
-            "images_count": total,
-            "current_index": current_index,
-            "delay_ms": delay_ms,
-            "is_playing": is_playing,
-            "current_image": current_image,
-            "status": build_status(images_snapshot, current_index, is_playing, last_error),
-            "error": last_error,
+    # Writers serialize through state.lock; readers only need a consistent
+    # enough view for status display, and each attribute load is atomic under
+    # the GIL, so no lock is taken here.
+    images_snapshot = state.images
+    total = len(images_snapshot)
+    current_index = state.current_index
+    delay_ms = state.delay_ms
+    is_playing = state.is_playing
+    last_error = state.last_error
+    current_image = None
+    if total:
+        index = current_index if current_index < total else 0
+        current_image = {
+            "index": index,
+            "total": total,
+            "name": images_snapshot.names[index],
+            "url": images_snapshot.urls[index],
         }
+    return {
+        "images_count": total,
+        "current_index": current_index,
+        "delay_ms": delay_ms,
+        "is_playing": is_playing,
+        "current_image": current_image,
+        "status": build_status(images_snapshot, current_index, is_playing, last_error),
+        "error": last_error,
+    }
 
 
 @app.get("/")
@@ -247,7 +427,35 @@ def viewer_alias() -> str:
 
 @app.get("/api/state")
 def api_state():
-    return jsonify(serialize_state())
+    # Serve the cached bytes while nothing has changed; clients poll this
+    # endpoint frequently and the payload is identical between changes.
+    version = state.version
+    etag = str(version)
+    if request.if_none_match.contains_weak(etag):
+        # A 304 carries the same validators the 200 would (RFC 9110).
+        not_modified = Response(status=304)
+        not_modified.set_etag(etag, weak=True)
+        return not_modified
+
+    body = state._cached_json
+    if body is None or state._cached_version != version:
+        body = orjson.dumps(serialize_state())
+        state._cached_json = body
+        state._cached_version = version
+
+    response = Response(body, mimetype="application/json")
+    response.set_etag(etag, weak=True)
+    response.cache_control.no_cache = True
+    return response
+
+
+# The success payload for the control endpoints never varies; skip jsonify's
+# dict encoding and hand the same bytes to a fresh Response each time.
+_OK_BODY = b'{"ok":true}'
+
+
+def _ok_response() -> Response:
+    return Response(_OK_BODY, mimetype="application/json")
 
 
 @app.post("/api/set_delay")
@@ -264,7 +472,7 @@ def api_set_delay():
         return jsonify({"error": f"delay_ms must be at least {MIN_DELAY_MS}"}), 400
 
     state.set_delay(delay_ms_int)
-    return jsonify({"ok": True})
+    return _ok_response()
 
 
 @app.post("/api/start")
@@ -273,36 +481,58 @@ def api_start():
         state.start()
     except ValueError as exc:
         return jsonify({"error": str(exc)}), 400
-    return jsonify({"ok": True})
+    return _ok_response()
 
 
 @app.post("/api/stop")
 def api_stop():
     state.stop()
-    return jsonify({"ok": True})
+    return _ok_response()
 
 
 @app.post("/api/reset")
 def api_reset():
     state.reset()
-    return jsonify({"ok": True})
+    return _ok_response()
 
 
 @app.get("/images/<int:index>/<path:filename>")
 def images(index: int, filename: str):
-    with state.lock:
-        if index < 0 or index >= len(state.images):
-            abort(404)
-        image = state.images[index]
-        if filename != image["name"]:
-            abort(404)
-        path = image["path"]
-
-    if not isinstance(path, Path) or not path.exists():
+    snapshot = state.images
+    if not 0 <= index < len(snapshot):
         abort(404)
+    if filename != snapshot.names[index]:
+        abort(404)
+    path_str = snapshot.path_strs[index]
+    mtime = snapshot.mtimes[index]
+
+    if X_ACCEL_REDIRECT_PREFIX:
+        # nginx swaps in the file from its internal location; only headers
+        # leave Python.
+        response = Response(mimetype=mimetypes.guess_type(filename)[0])
+        response.headers["X-Accel-Redirect"] = X_ACCEL_REDIRECT_PREFIX + quote(filename, safe="")
+        response.last_modified = mtime
+        return response
 
-    return send_file(path, conditional=True)
+    try:
+        if app.config["USE_X_SENDFILE"]:
+            # The proxy serves the bytes; keep them out of Python entirely.
+            return send_file(path_str, conditional=True, last_modified=mtime)
+        size = snapshot.sizes[index]
+        if size <= IMAGE_CACHE_MAX_BYTES:
+            # Slideshows cycle the same files repeatedly; serve small images
+            # straight from RAM instead of re-reading them from disk.
+            data = _read_image(path_str, mtime)
+            response = Response(data, mimetype=mimetypes.guess_type(filename)[0])
+            response.last_modified = mtime
+            response.set_etag(f"{mtime}-{size}")
+            return response.make_conditional(request)
+        return send_file(path_str, conditional=True, last_modified=mtime)
+    except FileNotFoundError:
+        abort(404)
 
 
 if __name__ == "__main__":
-    app.run(host="127.0.0.1", port=8080, debug=False, use_reloader=False)
+    # Werkzeug's dev server handles one request at a time; waitress gives a
+    # real thread pool. Keep a single process — state lives in this one.
+    waitress.serve(app, host="127.0.0.1", port=8080, threads=8)